@@ -3253,7 +3253,7 @@ class Synapse(object):
                             None,
                             fileHandle["key"],
                             destination,
-                            credentials=credentials,
+                            boto_session=sts_transfer.get_boto_session(credentials),
                             show_progress=not self.silent,
                             # pass through our synapse threading config to boto s3
                             transfer_config_kwargs={
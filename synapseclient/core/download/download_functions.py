@@ -473,7 +473,7 @@ async def download_by_file_handle(
                         endpoint_url=None,
                         remote_file_key=file_handle["key"],
                         download_file_path=destination,
-                        credentials=credentials,
+                        boto_session=sts_transfer.get_boto_session(credentials),
                         progress_bar=progress_bar,
                         # pass through our synapse threading config to boto s3
                         transfer_config_kwargs={"max_concurrency": syn.max_threads},
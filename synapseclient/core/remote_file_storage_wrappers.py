@@ -15,6 +15,9 @@ from synapseclient.core.transfer_bar import (
 )
 from synapseclient.core.utils import attempt_import
 
+if typing.TYPE_CHECKING:
+    import boto3
+
 
 class S3ClientWrapper:
     """
@@ -75,6 +78,7 @@ class S3ClientWrapper:
         *,
         profile_name: str = None,
         credentials: typing.Dict[str, str] = None,
+        boto_session: "boto3.session.Session" = None,
         progress_bar: Union[tqdm, None] = None,
         transfer_config_kwargs: dict = None,
     ) -> str:
@@ -94,6 +98,8 @@ class S3ClientWrapper:
                 - `aws_access_key_id`
                 - `aws_secret_access_key`
                 - `aws_session_token`
+            boto_session: an existing boto3 Session to use, if given profile_name and
+                credentials are ignored
             progress_bar: The progress bar to update. Defaults to None.
             transfer_config_kwargs: boto S3 transfer configuration (see boto3.s3.transfer.TransferConfig)
 
@@ -114,8 +120,11 @@ class S3ClientWrapper:
             **(transfer_config_kwargs or {})
         )
 
-        session_args = credentials if credentials else {"profile_name": profile_name}
-        boto_session = boto3.session.Session(**session_args)
+        if boto_session is None:
+            session_args = (
+                credentials if credentials else {"profile_name": profile_name}
+            )
+            boto_session = boto3.session.Session(**session_args)
         s3 = boto_session.resource("s3", endpoint_url=endpoint_url)
 
         try:
@@ -156,6 +165,7 @@ class S3ClientWrapper:
         *,
         profile_name: str = None,
         credentials: typing.Dict[str, str] = None,
+        boto_session: "boto3.session.Session" = None,
         show_progress: bool = True,
         transfer_config_kwargs: dict = None,
         storage_str: str = None,
@@ -176,6 +186,8 @@ class S3ClientWrapper:
                 - `aws_access_key_id`
                 - `aws_secret_access_key`
                 - `aws_session_token`
+            boto_session: an existing boto3 Session to use, if given profile_name and
+                credentials are ignored
             show_progress: whether to print progress indicator to console
             transfer_config_kwargs: boto S3 transfer configuration (see boto3.s3.transfer.TransferConfig)
 
@@ -199,8 +211,11 @@ class S3ClientWrapper:
             **(transfer_config_kwargs or {})
         )
 
-        session_args = credentials if credentials else {"profile_name": profile_name}
-        boto_session = boto3.session.Session(**session_args)
+        if boto_session is None:
+            session_args = (
+                credentials if credentials else {"profile_name": profile_name}
+            )
+            boto_session = boto3.session.Session(**session_args)
         s3 = boto_session.resource("s3", endpoint_url=endpoint_url)
 
         progress_callback = None
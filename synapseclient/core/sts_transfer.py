@@ -1,63 +1,171 @@
 import collections
 import collections.abc
 import datetime
+import functools
+import heapq
 import importlib
 import os
 import platform
 import threading
+import time
 from typing import TYPE_CHECKING
 
-from synapseclient.core.utils import iso_to_datetime, snake_case
+from synapseclient.core.utils import snake_case
 
 if TYPE_CHECKING:
     from synapseclient import Synapse
 
 try:
     boto3 = importlib.import_module("boto3")
+    # botocore is a dependency of boto3 so it is available whenever boto3 is
+    botocore_exceptions = importlib.import_module("botocore.exceptions")
 except ImportError:
     # boto is not a requirement to load this module,
     # we are able to optionally use functionality if it's available
     boto3 = None
+    botocore_exceptions = None
+
+# whether boto3 is importable doesn't change after this module is loaded
+_BOTO3_AVAILABLE = boto3 is not None
 
 STS_PERMISSIONS = set(["read_only", "read_write"])
 
 # default minimum life left on a cached token that we'll hand out.
 DEFAULT_MIN_LIFE = datetime.timedelta(hours=1)
 
+# the Synapse STS API returns camel cased keys that we need to convert to use with boto.
+# prefix with "aws_", convert to snake case, and exclude any other key/value pairs in the value
+# e.g. expiration
+_BOTO_KEY_MAP = tuple(
+    ("aws_{}".format(snake_case(k)), k)
+    for k in ("accessKeyId", "secretAccessKey", "sessionToken")
+)
+
+
+def _parse_sts_expiration(expiration_iso_str):
+    """
+    Parse the ISO 8601 expiration of an STS token into a timezone aware datetime.
+    STS tokens are returned with UTC ("Z") times, which fromisoformat only accepts
+    as an explicit offset on the Python versions we support.
+    """
+    if expiration_iso_str.endswith("Z"):
+        expiration_iso_str = expiration_iso_str[:-1] + "+00:00"
+    return datetime.datetime.fromisoformat(expiration_iso_str)
+
 
 class _TokenCache(collections.OrderedDict):
     """
     A self pruning dictionary of STS tokens.
-    It will prune itself as new keys are added, removing the oldest if the
-    max_size is exceeded, and always removing all tokens that have expired
-    on each additional insert.
+    It will prune itself as new tokens are added with put, removing the least
+    recently used if the max_size is exceeded, and always removing all tokens that
+    have expired on each additional put.
+
+    Values are (token, expiration timestamp) tuples so that the expiration of a
+    token is only parsed once, when it is added.
     """
 
     def __init__(self, max_size):
         super().__init__()
         self.max_size = max_size
 
-    def __setitem__(self, key, value):
-        super().__setitem__(key, value)
+        # the heap holds (expiration timestamp, key) pairs so that pruning only has
+        # to visit tokens that have actually expired. entries for tokens that have
+        # since been replaced or evicted are left in the heap and skipped when popped.
+        self._expiry_heap = []
+
+    def put(self, key, token):
+        """
+        Add a token to the cache, stored as a (token, expiration timestamp) tuple.
+
+        Arguments:
+            key: The entity id the token is for
+            token: The STS token as returned by Synapse
+        """
+        expiration_ts = _parse_sts_expiration(token["expiration"]).timestamp()
+        self[key] = (token, expiration_ts)
+        # replacing an existing key doesn't change its position so mark it as most recently used
+        self.move_to_end(key)
+        heapq.heappush(self._expiry_heap, (expiration_ts, key))
         self._prune()
 
+    def _is_current(self, key, expiration_ts):
+        cached = self.get(key)
+        return cached is not None and cached[1] == expiration_ts
+
     def _prune(self):
         while len(self) > self.max_size:
             self.popitem(last=False)
 
-        to_delete = []
-        before_timestamp = datetime.datetime.utcnow().timestamp()
-        for entity_id, token in self.items():
-            expiration_iso_str = token["expiration"]
+        before_timestamp = time.time()
+        while self._expiry_heap and self._expiry_heap[0][0] < before_timestamp:
+            expiration_ts, entity_id = heapq.heappop(self._expiry_heap)
 
-            # our "iso_to_datetime" util naively assumes UTC ("Z") times which in practice STS tokens are
-            if iso_to_datetime(expiration_iso_str).timestamp() < before_timestamp:
-                to_delete.append(entity_id)
-            else:
-                break
+            # the heap entry may be stale if the token was since replaced or evicted
+            if self._is_current(entity_id, expiration_ts):
+                del self[entity_id]
+
+        if len(self._expiry_heap) > 2 * self.max_size:
+            # too many stale entries have accumulated, drop them from the heap
+            self._expiry_heap = [
+                (ts, key) for ts, key in self._expiry_heap if self._is_current(key, ts)
+            ]
+            heapq.heapify(self._expiry_heap)
+
+
+class _BotoSessionCache(collections.OrderedDict):
+    """
+    A least recently used cache of boto3 Sessions keyed by the STS session token
+    they were created with.
+
+    Creating a Session is cheap but the clients and resources made from it are not,
+    a new Session has to load the service models from disk again for every transfer.
+    Reusing the Session for as long as the STS token is reused avoids that.
+    """
+
+    # STS tokens are cached per entity but many entities share a storage location
+    # and so a token, a handful of live sessions per thread is enough
+    DEFAULT_MAX_SIZE = 16
+
+    def __init__(self, max_size=DEFAULT_MAX_SIZE):
+        super().__init__()
+        self.max_size = max_size
+
+    def get_session(self, credentials):
+        key = credentials["aws_session_token"]
+        session = self.get(key)
+        if session is not None:
+            self.move_to_end(key)
+            return session
+
+        session = self[key] = boto3.session.Session(**credentials)
+        while len(self) > self.max_size:
+            self.popitem(last=False)
+
+        return session
 
-        for entity_id in to_delete:
-            del self[entity_id]
+
+# boto3 Sessions are not thread safe so each thread keeps its own cache of them
+_boto_sessions = threading.local()
+
+
+def get_boto_session(credentials):
+    """
+    Get a boto3 Session for the given STS credentials, reusing the Session previously
+    created by this thread for the same credentials if there is one.
+
+    Arguments:
+        credentials: a dictionary with the `aws_access_key_id`, `aws_secret_access_key`,
+            and `aws_session_token` as keys, as returned by
+            get_sts_credentials with the boto output format
+
+    Returns:
+        A boto3 Session
+    """
+    session_cache = getattr(_boto_sessions, "cache", None)
+    if session_cache is None:
+        session_cache = _boto_sessions.cache = _BotoSessionCache()
+
+    return session_cache.get_session(credentials)
 
 
 class StsTokenStore:
@@ -75,28 +183,123 @@ class StsTokenStore:
     # a memory leak.
     DEFAULT_TOKEN_CACHE_SIZE = 5000
 
-    def __init__(self, max_token_cache_size=DEFAULT_TOKEN_CACHE_SIZE):
+    # there are far fewer storage locations than entities, this only bounds the
+    # cache for a long lived process that touches an unusual number of them
+    DEFAULT_STS_ENABLED_LOCATION_CACHE_SIZE = 256
+
+    def __init__(
+        self,
+        max_token_cache_size=DEFAULT_TOKEN_CACHE_SIZE,
+        max_sts_enabled_location_cache_size=DEFAULT_STS_ENABLED_LOCATION_CACHE_SIZE,
+    ):
         self._tokens = {p: _TokenCache(max_token_cache_size) for p in STS_PERMISSIONS}
         self._lock = threading.Lock()
 
+        # the lock is not held while fetching a token, instead an Event is registered
+        # for each (permission, entity_id) being fetched so concurrent requests for the
+        # same token wait on the single fetch rather than making their own
+        self._fetches_in_flight = {}
+
+        # whether a storage location is STS enabled is a property of the location
+        # and doesn't change, so we only need to look it up once per storage location id
+        self._sts_enabled_locations = collections.OrderedDict()
+        self._max_sts_enabled_location_cache_size = max_sts_enabled_location_cache_size
+
     def get_token(
         self, syn, entity_id, permission, min_remaining_life: datetime.timedelta
     ):
+        token_cache = self._tokens.get(permission)
+        if token_cache is None:
+            raise ValueError(f"Invalid STS permission {permission}")
+
+        min_remaining_life_s = min_remaining_life.total_seconds()
+
+        # cache hits don't take the lock, the individual OrderedDict operations are
+        # atomic so at worst we see a token that is concurrently being replaced
+        token = self._get_unexpired_token(token_cache, entity_id, min_remaining_life_s)
+        if token is not None:
+            return token
+
+        fetch_key = (permission, entity_id)
+        while True:
+            with self._lock:
+                token = self._get_unexpired_token(
+                    token_cache, entity_id, min_remaining_life_s
+                )
+                if token is not None:
+                    return token
+
+                # either there is no cached token or the remaining life on the token isn't enough so fetch new,
+                # unless another thread is already fetching it
+                fetch_event = self._fetches_in_flight.get(fetch_key)
+                if fetch_event is None:
+                    fetch_event = self._fetches_in_flight[fetch_key] = threading.Event()
+                    break
+
+            fetch_event.wait()
+
+        try:
+            token = self._fetch_token(syn, entity_id, permission)
+            with self._lock:
+                token_cache.put(entity_id, token)
+        finally:
+            with self._lock:
+                del self._fetches_in_flight[fetch_key]
+
+            # waiting threads will find the new token in the cache,
+            # or if the fetch failed they will try to fetch it themselves
+            fetch_event.set()
+
+        return token
+
+    def get_sts_enabled(self, location):
+        """
+        Return whether the storage location was previously found to be STS enabled,
+        or None if it hasn't been looked up.
+        """
+        sts_enabled = self._sts_enabled_locations.get(location)
+        if sts_enabled is not None:
+            try:
+                self._sts_enabled_locations.move_to_end(location)
+            except KeyError:
+                # evicted by another thread since we looked it up
+                pass
+        return sts_enabled
+
+    def set_sts_enabled(self, location, sts_enabled):
+        """
+        Record whether the storage location is STS enabled, evicting the least
+        recently used location if the cache is full.
+        """
         with self._lock:
-            utcnow = datetime.datetime.utcnow()
-            token_cache = self._tokens.get(permission)
-            if token_cache is None:
-                raise ValueError(f"Invalid STS permission {permission}")
-
-            token = token_cache.get(entity_id)
-            if (
-                not token
-                or (iso_to_datetime(token["expiration"]) - utcnow) < min_remaining_life
+            self._sts_enabled_locations[location] = sts_enabled
+            self._sts_enabled_locations.move_to_end(location)
+            while (
+                len(self._sts_enabled_locations)
+                > self._max_sts_enabled_location_cache_size
             ):
-                # either there is no cached token or the remaining life on the token isn't enough so fetch new
-                token = token_cache[entity_id] = self._fetch_token(
-                    syn, entity_id, permission
-                )
+                self._sts_enabled_locations.popitem(last=False)
+
+    @staticmethod
+    def _get_unexpired_token(token_cache, entity_id, min_remaining_life_s):
+        """
+        Return the cached token for the entity if it has at least min_remaining_life_s
+        seconds left before it expires, otherwise None.
+        """
+        cached = token_cache.get(entity_id)
+        if cached is None:
+            return None
+
+        token, expiration_ts = cached
+        if expiration_ts - time.time() < min_remaining_life_s:
+            return None
+
+        try:
+            # refresh the position of the token so the most used tokens are the last evicted
+            token_cache.move_to_end(entity_id)
+        except KeyError:
+            # pruned by another thread since we looked it up, the token is still good
+            pass
 
         return token
 
@@ -107,22 +310,22 @@ class StsTokenStore:
 
 EXPORT_TEMPLATE_STRINGS = {
     "bash": """\
-export SYNAPSE_STS_S3_LOCATION="s3://{bucket}/{baseKey}"
-export AWS_ACCESS_KEY_ID="{accessKeyId}"
-export AWS_SECRET_ACCESS_KEY="{secretAccessKey}"
-export AWS_SESSION_TOKEN="{sessionToken}"
+export SYNAPSE_STS_S3_LOCATION="s3://%(bucket)s/%(baseKey)s"
+export AWS_ACCESS_KEY_ID="%(accessKeyId)s"
+export AWS_SECRET_ACCESS_KEY="%(secretAccessKey)s"
+export AWS_SESSION_TOKEN="%(sessionToken)s"
 """,
     "cmd": """\
-set SYNAPSE_STS_S3_LOCATION="s3://{bucket}/{baseKey}"
-set AWS_ACCESS_KEY_ID="{accessKeyId}"
-set AWS_SECRET_ACCESS_KEY="{secretAccessKey}"
-set AWS_SESSION_TOKEN="{sessionToken}"
+set SYNAPSE_STS_S3_LOCATION="s3://%(bucket)s/%(baseKey)s"
+set AWS_ACCESS_KEY_ID="%(accessKeyId)s"
+set AWS_SECRET_ACCESS_KEY="%(secretAccessKey)s"
+set AWS_SESSION_TOKEN="%(sessionToken)s"
 """,
     "powershell": """\
-$Env:SYNAPSE_STS_S3_LOCATION="s3://{bucket}/{baseKey}"
-$Env:AWS_ACCESS_KEY_ID="{accessKeyId}"
-$Env:AWS_SECRET_ACCESS_KEY="{secretAccessKey}"
-$Env:AWS_SESSION_TOKEN="{sessionToken}"
+$Env:SYNAPSE_STS_S3_LOCATION="s3://%(bucket)s/%(baseKey)s"
+$Env:AWS_ACCESS_KEY_ID="%(accessKeyId)s"
+$Env:AWS_SECRET_ACCESS_KEY="%(secretAccessKey)s"
+$Env:AWS_SESSION_TOKEN="%(sessionToken)s"
 """,
 }
 
@@ -146,7 +349,22 @@ def _format_export_template_string(syn, entity_id, credentials, template_string)
     if any(k not in subs for k in bucket_keys):
         template_string = template_string[template_string.find("\n") + 1 :]
 
-    return template_string.format(**subs)
+    return template_string % subs
+
+
+@functools.lru_cache()
+def _detect_shell_output_format():
+    """
+    For "shell" output we try to detect what is best for the system.
+    The shell a process is running in doesn't change so this is only detected once.
+    """
+    # assume bourne compatible output outside of windows
+    if platform.system() == "Windows" and "bash" not in os.environ.get("SHELL", ""):
+        if len(os.getenv("PSModulePath", "").split(os.pathsep)) >= 3:
+            # https://stackoverflow.com/a/55598796
+            return "powershell"
+        return "cmd"
+    return "bash"
 
 
 def get_sts_credentials(
@@ -160,28 +378,13 @@ def get_sts_credentials(
     )
 
     if output_format == "boto":
-        # the Synapse STS API returns camel cased keys that we need to convert to use with boto.
-        # prefix with "aws_", convert to snake case, and exclude any other key/value pairs in the value
-        # e.g. expiration
-        return {
-            "aws_{}".format(snake_case(k)): value[k]
-            for k in ("accessKeyId", "secretAccessKey", "sessionToken")
-        }
+        return {boto_key: value[sts_key] for boto_key, sts_key in _BOTO_KEY_MAP}
     elif output_format == "json":
         # pass through what server sent
         return value
 
     elif output_format == "shell":
-        # for "shell" we try to detect what is best for the system
-        # assume bourne compatible output outside of windows
-        if platform.system() == "Windows" and "bash" not in os.environ.get("SHELL", ""):
-            if len(os.getenv("PSModulePath", "").split(os.pathsep)) >= 3:
-                # https://stackoverflow.com/a/55598796
-                output_format = "powershell"
-            else:
-                output_format = "cmd"
-        else:
-            output_format = "bash"
+        output_format = _detect_shell_output_format()
 
     template_string = EXPORT_TEMPLATE_STRINGS.get(output_format)
     if not template_string:
@@ -201,6 +404,9 @@ def with_boto_sts_credentials(fn, syn, entity_id, permission):
     worry that they will expire in the middle of running and cause an unrecoverable error.
     The alternative of fetching a fresh STS token for every request might be okay for a few large files
     but would greatly slow down transferring many small files.
+
+    The function can pass the credentials to get_boto_session to reuse a boto3 Session
+    across calls made with the same credentials.
     """
 
     for attempt in range(2):
@@ -209,7 +415,16 @@ def with_boto_sts_credentials(fn, syn, entity_id, permission):
         )
         try:
             response = fn(credentials)
+        except botocore_exceptions.ClientError as ex:
+            # errors from the service carry a structured error code
+            error_code = ex.response.get("Error", {}).get("Code")
+            if error_code == "ExpiredToken" and attempt == 0:
+                continue
+            else:
+                raise
         except boto3.exceptions.Boto3Error as ex:
+            # boto3's own errors (e.g. S3UploadFailedError) only include the
+            # underlying error code in their message
             if "ExpiredToken" in str(ex) and attempt == 0:
                 continue
             else:
@@ -230,7 +445,7 @@ def is_boto_sts_transfer_enabled(syn):
     Returns:
         True if STS if enabled, False otherwise
     """
-    return bool(boto3 and syn.use_boto_sts_transfers)
+    return _BOTO3_AVAILABLE and bool(syn.use_boto_sts_transfers)
 
 
 def is_storage_location_sts_enabled(syn, entity_id, location):
@@ -254,10 +469,15 @@ def is_storage_location_sts_enabled(syn, entity_id, location):
 
     else:
         # otherwise treat it as a storage location id,
-        destination = syn.restGET(
-            f"/entity/{entity_id}/uploadDestination/{location}",
-            endpoint=syn.fileHandleEndpoint,
-        )
+        sts_enabled = syn._sts_token_store.get_sts_enabled(location)
+        if sts_enabled is None:
+            destination = syn.restGET(
+                f"/entity/{entity_id}/uploadDestination/{location}",
+                endpoint=syn.fileHandleEndpoint,
+            )
+            sts_enabled = bool(destination.get("stsEnabled", False))
+            syn._sts_token_store.set_sts_enabled(location, sts_enabled)
+        return sts_enabled
 
     return destination.get("stsEnabled", False)
 
@@ -288,8 +508,13 @@ async def is_storage_location_sts_enabled_async(
         from synapseclient.api.entity_services import get_upload_destination_location
 
         # otherwise treat it as a storage location id,
-        destination = await get_upload_destination_location(
-            entity_id=entity_id, location=location, synapse_client=syn
-        )
+        sts_enabled = syn._sts_token_store.get_sts_enabled(location)
+        if sts_enabled is None:
+            destination = await get_upload_destination_location(
+                entity_id=entity_id, location=location, synapse_client=syn
+            )
+            sts_enabled = bool(destination.get("stsEnabled", False))
+            syn._sts_token_store.set_sts_enabled(location, sts_enabled)
+        return sts_enabled
 
     return destination.get("stsEnabled", False)
@@ -330,7 +330,7 @@ def upload_synapse_sts_boto_s3(
             endpoint_url=None,
             remote_file_key=remote_file_key,
             upload_file_path=local_path,
-            credentials=credentials,
+            boto_session=sts_transfer.get_boto_session(credentials),
             transfer_config_kwargs={"max_concurrency": syn.max_threads},
         )
 
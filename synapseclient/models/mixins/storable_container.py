@@ -171,15 +171,15 @@ class StorableContainer(StorableContainerSynchronousProtocol):
             activate project_or_folder
             project_or_folder->>sync_from_synapse: Recursive search and download files
             activate sync_from_synapse
-                opt Current instance not retrieved from Synapse
+                par Current instance not retrieved from Synapse
                     sync_from_synapse->>project_or_folder: Call `.get()` method
                     project_or_folder-->>sync_from_synapse: .
-                end
-
-                loop For each return of the generator
-                    sync_from_synapse->>client: call `.getChildren()` method
-                    client-->>sync_from_synapse: .
-                    note over sync_from_synapse: Append to a running list
+                and List children, started first when the ID is known
+                    loop For each return of the generator
+                        sync_from_synapse->>client: call `.getChildren()` method
+                        client-->>sync_from_synapse: .
+                        note over sync_from_synapse: Append to a running list
+                    end
                 end
 
                 loop For each child
@@ -224,21 +224,39 @@ class StorableContainer(StorableContainerSynchronousProtocol):
         ```
 
         """
+        loop = asyncio.get_event_loop()
+
+        def retrieve_children() -> asyncio.Future:
+            return loop.run_in_executor(
+                None,
+                lambda: self._retrieve_children(
+                    follow_link=follow_link,
+                    synapse_client=synapse_client,
+                ),
+            )
+
+        # When the ID is already known the children can be listed at the same time as
+        # this container is retrieved, rather than waiting on one round trip before
+        # starting the other at every level of the hierarchy.
+        children_future = retrieve_children() if self.id else None
         if not self._last_persistent_instance:
-            await self.get_async(synapse_client=synapse_client)
+            try:
+                await self.get_async(synapse_client=synapse_client)
+            except BaseException:
+                # the children are not needed if this container could not be
+                # retrieved, cancelling also means a failed listing isn't left with
+                # an exception that is never retrieved
+                if children_future is not None:
+                    children_future.cancel()
+                raise
         Synapse.get_client(synapse_client=synapse_client).logger.info(
             f"Syncing {self.__class__.__name__} ({self.id}:{self.name}) from Synapse."
         )
         path = os.path.expanduser(path) if path else None
 
-        loop = asyncio.get_event_loop()
-        children = await loop.run_in_executor(
-            None,
-            lambda: self._retrieve_children(
-                follow_link=follow_link,
-                synapse_client=synapse_client,
-            ),
-        )
+        if children_future is None:
+            children_future = retrieve_children()
+        children = await children_future
 
         pending_tasks = []
         self.folders = []
@@ -271,17 +289,21 @@ class StorableContainer(StorableContainerSynchronousProtocol):
 
     def flatten_file_list(self) -> List["File"]:
         """
-        Recursively loop over all of the already retrieved files and folders and return
-        a list of all files in the container.
+        Loop over all of the already retrieved files and folders and return a list of
+        all files in the container. Files are returned depth first, with the files of a
+        container preceding the files of its sub-folders.
 
         Returns:
             A list of all files in the container.
         """
         files = []
-        for file in self.files:
-            files.append(file)
-        for folder in self.folders:
-            files.extend(folder.flatten_file_list())
+        # walk the hierarchy with an explicit stack rather than recursing so each file
+        # is only copied into the result once regardless of how deeply it is nested
+        containers = [self]
+        while containers:
+            container = containers.pop()
+            files.extend(container.files)
+            containers.extend(reversed(container.folders))
         return files
 
     def map_directory_to_all_contained_files(
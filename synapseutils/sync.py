@@ -5,6 +5,7 @@ import asyncio
 import csv
 import datetime
 import io
+import itertools
 import os
 import re
 import sys
@@ -408,7 +409,7 @@ class _SyncUploader:
 
         for item in items:
             item_file_provenance = []
-            for provenance_dependency in item.used + item.executed:
+            for provenance_dependency in itertools.chain(item.used, item.executed):
                 is_file = resolved_file_checks.get(
                     provenance_dependency, None
                 ) or os.path.isfile(provenance_dependency)
@@ -919,8 +920,14 @@ def _write_manifest_data(filename: str, keys: List[str], data: List[dict]) -> No
 
 
 def _sortAndFixProvenance(syn, df):
+    import pandas as pd
+
     df = df.set_index("path")
-    uploadOrder = {}
+    paths = set(df.index)
+    # the same provenance item is often referenced by many rows, only stat it once
+    # and only look up files that are not being uploaded in Synapse once
+    resolved_file_checks = {}
+    provenance_cache = {}
 
     def _checkProvenace(item, path):
         """Determines if provenance item is valid"""
@@ -930,14 +937,22 @@ def _sortAndFixProvenance(syn, df):
         item_path_normalized = os.path.abspath(
             os.path.expandvars(os.path.expanduser(item))
         )
-        if os.path.isfile(item_path_normalized):
+        is_file = resolved_file_checks.get(item_path_normalized)
+        if is_file is None:
+            is_file = resolved_file_checks[item_path_normalized] = os.path.isfile(
+                item_path_normalized
+            )
+        if is_file:
             # Add full path
             item = item_path_normalized
-            if item not in df.index:  # If it is a file and it is not being uploaded
+            if item not in paths:  # If it is a file and it is not being uploaded
+                if item in provenance_cache:
+                    return provenance_cache[item]
                 try:
-                    bundle = syn._getFromFile(item)
+                    bundle = provenance_cache[item] = syn._getFromFile(item)
                     return bundle
                 except SynapseFileNotFoundError:
+                    provenance_cache[item] = item
                     # TODO absence of a raise here appears to be a bug and yet tests fail if this is raised
                     SynapseProvenanceError(
                         (
@@ -954,25 +969,26 @@ def _sortAndFixProvenance(syn, df):
             )
         return item
 
-    for path, row in df.iterrows():
-        allRefs = []
-        if "used" in row:
-            used = (
-                row["used"].split(";") if (row["used"].strip() != "") else []
-            )  # Get None or split if string
-            df.at[path, "used"] = [_checkProvenace(item.strip(), path) for item in used]
-            allRefs.extend(df.loc[path, "used"])
-        if "executed" in row:
-            # Get None or split if string
-            executed = (
-                row["executed"].split(";") if (row["executed"].strip() != "") else []
+    all_refs = [[] for _ in df.index]
+    for column in PROVENANCE_FIELDS:
+        if column not in df:
+            continue
+
+        # split the cells of the whole column at once, cells without any provenance
+        # are left as an empty list
+        split_cells = df[column].str.split(";").where(df[column].str.strip() != "")
+        checked_cells = []
+        for path, items, refs in zip(df.index, split_cells, all_refs):
+            checked_items = (
+                [_checkProvenace(item.strip(), path) for item in items]
+                if isinstance(items, list)
+                else []
             )
-            df.at[path, "executed"] = [
-                _checkProvenace(item.strip(), path) for item in executed
-            ]
-            allRefs.extend(df.loc[path, "executed"])
-        uploadOrder[path] = allRefs
+            checked_cells.append(checked_items)
+            refs.extend(checked_items)
+        df[column] = pd.Series(checked_cells, index=df.index, dtype=object)
 
+    uploadOrder = dict(zip(df.index, all_refs))
     uploadOrder = utils.topolgical_sort(uploadOrder)
     df = df.reindex([i[0] for i in uploadOrder])
     return df.reset_index()
@@ -992,6 +1008,32 @@ def _check_path_and_normalize(f):
     return path_normalized
 
 
+def _manifest_cell_to_bool(cell: str) -> Union[bool, None]:
+    """
+    Converts a manifest cell into a bool the same way as pandas reading a boolean or
+    numeric column and casting it to bool.
+
+    Arguments:
+        cell: The cell to convert.
+
+    Returns:
+        None if the cell is empty, the bool for true/false in any case, whether the
+            number is non zero for a numeric cell, otherwise True as any other text
+            is truthy.
+    """
+    if cell == "":
+        return None
+
+    possible_bool = bool_or_none(cell)
+    if possible_bool is not None:
+        return possible_bool
+
+    try:
+        return float(cell) != 0
+    except ValueError:
+        return True
+
+
 def readManifestFile(syn, manifestFile):
     """Verifies a file manifest and returns a reordered dataframe ready for upload.
 
@@ -1011,18 +1053,30 @@ def readManifestFile(syn, manifestFile):
         sys.stdout.write("Validation and upload of: <stdin>\n")
     else:
         sys.stdout.write("Validation and upload of: %s\n" % manifestFile)
-    # Read manifest file into pandas dataframe
-    df = pd.read_csv(manifestFile, sep="\t")
+    # Read manifest file into pandas dataframe. Every cell is read as a string rather
+    # than inferring types, annotations are converted to python types later on in the
+    # upload. Empty cells and pandas' NA markers such as "NA" or "null" still mean no
+    # value, "None" is only one of those markers by default in newer versions of pandas.
+    df = pd.read_csv(
+        manifestFile,
+        sep="\t",
+        engine="c",
+        dtype=str,
+        na_values=["None"],
+    ).fillna("")
     if "synapseStore" not in df:
-        df = df.assign(synapseStore=None)
-    df.loc[
-        df["path"].apply(is_url), "synapseStore"
-    ] = False  # override synapseStore values to False when path is a url
-    df.loc[
-        df["synapseStore"].isnull(), "synapseStore"
-    ] = True  # remaining unset values default to True
-    df.synapseStore = df.synapseStore.astype(bool)
-    df = df.fillna("")
+        df = df.assign(synapseStore="")
+    # synapseStore values are False when path is a url, remaining unset values
+    # default to True
+    df.synapseStore = [
+        not is_url(path) and _manifest_cell_to_bool(synapse_store) is not False
+        for path, synapse_store in zip(df.path, df.synapseStore)
+    ]
+    if "forceVersion" in df:
+        df.forceVersion = [
+            bool(_manifest_cell_to_bool(force_version))
+            for force_version in df.forceVersion
+        ]
 
     sys.stdout.write("Validating columns of manifest...")
     for field in REQUIRED_FIELDS:
@@ -1103,11 +1157,10 @@ def syncToSynapse(
 
     ## Conversion of annotations from the TSV file to Python native objects
 
-    The first annotation conversion is from the TSV file into a Python native object. For
-    example Pandas will read a TSV file and convert the string "True" into a boolean True,
-    however, Pandas will NOT convert our comma delimited and bracket wrapped list of
-    annotations into their Python native objects. This means that we need to do that
-    conversion here after splitting them apart.
+    The first annotation conversion is from the TSV file into a Python native object. The
+    manifest is read with every cell as a string, so for example the string "True" is
+    converted into a boolean True and our comma delimited and bracket wrapped list of
+    annotations is split apart and converted into their Python native objects here.
 
     ## Conversion of Python native objects for the REST API
 
@@ -104,6 +104,24 @@ class TestS3ClientWrapper:
         }
         self._download_test(credentials=credentials, show_progress=False)
 
+    def test_download__boto_session(self) -> None:
+        """Verify downloading using a supplied boto session doesn't create a new one"""
+        boto_session = mock.Mock()
+
+        with mock.patch("boto3.session.Session") as mock_boto_session, mock.patch(
+            "boto3.s3.transfer.TransferConfig"
+        ):
+            S3ClientWrapper.download_file(
+                "foo_bucket",
+                None,
+                "foo/bar/baz",
+                "/tmp/download",
+                boto_session=boto_session,
+            )
+
+        assert not mock_boto_session.called
+        boto_session.resource.assert_called_once_with("s3", endpoint_url=None)
+
     @staticmethod
     def _download_error_test(exception, raised_type) -> None:
         bucket_name = "foo_bucket"
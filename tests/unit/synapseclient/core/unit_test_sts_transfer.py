@@ -1,13 +1,17 @@
 import datetime
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from unittest import mock
 
 import boto3
+import botocore.exceptions
 import pytest
 
 from synapseclient import Synapse
 from synapseclient.core import sts_transfer
 from synapseclient.core.sts_transfer import (
     StsTokenStore,
+    _BotoSessionCache,
     _TokenCache,
     with_boto_sts_credentials,
 )
@@ -18,6 +22,10 @@ class TestGetStsCredentials:
     def setup_class(cls):
         cls._utcnow = datetime.datetime.utcnow()
 
+    def setup_method(self):
+        # shell detection is cached but the tests vary the detected platform
+        sts_transfer._detect_shell_output_format.cache_clear()
+
     @classmethod
     def _make_credentials(cls, bucket_items=None):
         credentials = {
@@ -173,6 +181,7 @@ export AWS_SESSION_TOKEN="baz"
         """Verify we treat any other os as running in a bash compatible shell"""
         for platform in ("Linux", "Darwin", "AnythingElse"):
             mock_platform.system.return_value = platform
+            sts_transfer._detect_shell_output_format.cache_clear()
             self._bash_test("shell")
 
     def test_json_format(self):
@@ -261,52 +270,123 @@ class TestTokenCache:
         }
 
         for i in range(max_size + ejections):
-            token_cache[f"syn_{i}"] = token
+            token_cache.put(f"syn_{i}", token)
 
         expected_keys = [f"syn_{i}" for i in range(ejections, max_size + ejections)]
         assert expected_keys == list(token_cache.keys())
 
-    @mock.patch("synapseclient.core.sts_transfer.datetime")
-    def test_old_tokens_pruned(self, mock_datetime):
+    @mock.patch("synapseclient.core.sts_transfer.time")
+    def test_old_tokens_pruned(self, mock_time):
         """Verify that tokens that do not have the remaining min_life before their expiration are not returned
         and are pruned as new tokens are added."""
 
-        # we mock datetime and drop subseconds to make results to the second deterministic
+        # we mock time and drop subseconds to make results to the second deterministic
         # as they go back and forth bewteen parsing etc
-        utc_now = datetime.datetime.utcnow().replace(microsecond=0)
-        mock_datetime.datetime.utcnow = mock.Mock(return_value=utc_now)
+        utc_now = datetime.datetime.now(datetime.timezone.utc).replace(microsecond=0)
+        mock_time.time.return_value = utc_now.timestamp()
 
         token_cache = _TokenCache(1000)
 
         # this token should be immediately pruned
-        token_cache["syn_1"] = {
-            "expiration": datetime_to_iso(utc_now - datetime.timedelta(seconds=1))
-        }
+        token_cache.put(
+            "syn_1",
+            {"expiration": datetime_to_iso(utc_now - datetime.timedelta(seconds=1))},
+        )
         assert 0 == len(token_cache)
 
-        token_cache["syn_2"] = {
-            "expiration": datetime_to_iso(utc_now + datetime.timedelta(seconds=1))
-        }
-        token_cache["syn_3"] = {
-            "expiration": datetime_to_iso(utc_now + datetime.timedelta(minutes=1))
-        }
-        token_cache["syn_4"] = {
-            "expiration": datetime_to_iso(utc_now + datetime.timedelta(hours=1))
-        }
+        token_cache.put(
+            "syn_2",
+            {"expiration": datetime_to_iso(utc_now + datetime.timedelta(seconds=1))},
+        )
+        token_cache.put(
+            "syn_3",
+            {"expiration": datetime_to_iso(utc_now + datetime.timedelta(minutes=1))},
+        )
+        token_cache.put(
+            "syn_4",
+            {"expiration": datetime_to_iso(utc_now + datetime.timedelta(hours=1))},
+        )
 
         # all the additional keys should still be there
         assert ["syn_2", "syn_3", "syn_4"] == list(token_cache.keys())
 
         # if we set a new key in the future any keys that are expired at that time should be pruned
-        mock_datetime.datetime.utcnow = mock.Mock(
-            return_value=utc_now + datetime.timedelta(minutes=30)
-        )
+        mock_time.time.return_value = (
+            utc_now + datetime.timedelta(minutes=30)
+        ).timestamp()
 
-        token_cache["syn_5"] = {
-            "expiration": datetime_to_iso(utc_now + datetime.timedelta(days=1))
-        }
+        token_cache.put(
+            "syn_5",
+            {"expiration": datetime_to_iso(utc_now + datetime.timedelta(days=1))},
+        )
         assert ["syn_4", "syn_5"] == list(token_cache.keys())
 
+    @mock.patch("synapseclient.core.sts_transfer.time")
+    def test_replaced_token_not_pruned(self, mock_time):
+        """Verify that replacing a token with a fresher one for the same key means the
+        new token survives a prune that would have expired the old one."""
+        utc_now = datetime.datetime.now(datetime.timezone.utc).replace(microsecond=0)
+        mock_time.time.return_value = utc_now.timestamp()
+
+        token_cache = _TokenCache(1000)
+        token_cache.put(
+            "syn_1",
+            {"expiration": datetime_to_iso(utc_now + datetime.timedelta(minutes=1))},
+        )
+        token_cache.put(
+            "syn_1",
+            {"expiration": datetime_to_iso(utc_now + datetime.timedelta(hours=1))},
+        )
+
+        mock_time.time.return_value = (
+            utc_now + datetime.timedelta(minutes=30)
+        ).timestamp()
+        token_cache.put(
+            "syn_2",
+            {"expiration": datetime_to_iso(utc_now + datetime.timedelta(days=1))},
+        )
+        assert ["syn_1", "syn_2"] == list(token_cache.keys())
+
+    @mock.patch("synapseclient.core.sts_transfer.time")
+    def test_expired_tokens_pruned_out_of_insertion_order(self, mock_time):
+        """Verify that expired tokens are pruned even if they were inserted after
+        tokens that expire later."""
+        utc_now = datetime.datetime.now(datetime.timezone.utc).replace(microsecond=0)
+        mock_time.time.return_value = utc_now.timestamp()
+
+        token_cache = _TokenCache(1000)
+        token_cache.put(
+            "syn_1",
+            {"expiration": datetime_to_iso(utc_now + datetime.timedelta(days=1))},
+        )
+        token_cache.put(
+            "syn_2",
+            {"expiration": datetime_to_iso(utc_now + datetime.timedelta(minutes=1))},
+        )
+
+        mock_time.time.return_value = (
+            utc_now + datetime.timedelta(minutes=30)
+        ).timestamp()
+        token_cache.put(
+            "syn_3",
+            {"expiration": datetime_to_iso(utc_now + datetime.timedelta(days=1))},
+        )
+        assert ["syn_1", "syn_3"] == list(token_cache.keys())
+
+    def test_put_stores_expiration(self):
+        """Verify that tokens are stored alongside their parsed expiration timestamp"""
+        expiration = datetime.datetime(2024, 1, 1, tzinfo=datetime.timezone.utc)
+        token = {"expiration": datetime_to_iso(expiration)}
+
+        token_cache = _TokenCache(1000)
+        with mock.patch("synapseclient.core.sts_transfer.time") as mock_time:
+            mock_time.time.return_value = (
+                expiration - datetime.timedelta(hours=1)
+            ).timestamp()
+            token_cache.put("syn_1", token)
+
+        assert (token, expiration.timestamp()) == token_cache["syn_1"]
+
 
 class TestStsTokenStore:
     def test_invalid_permission(self):
@@ -363,6 +443,161 @@ class TestStsTokenStore:
         assert token is write_token
         assert syn.restGET.call_count == 2
 
+    def test_cache_hit_refreshes_lru_order(self):
+        """Verify that a cache hit marks the token as most recently used so that
+        frequently used tokens are not the first evicted when the cache is full."""
+        token_store = StsTokenStore(max_token_cache_size=2)
+        min_remaining_life = datetime.timedelta(hours=1)
+
+        expiration = datetime_to_iso(
+            datetime.datetime.utcnow() + datetime.timedelta(hours=10)
+        )
+        syn = mock.Mock(
+            restGET=mock.Mock(side_effect=lambda uri: {"expiration": expiration})
+        )
+
+        token_store.get_token(syn, "syn_1", "read_only", min_remaining_life)
+        token_store.get_token(syn, "syn_2", "read_only", min_remaining_life)
+
+        # syn_1 is used again so syn_2 should be evicted when syn_3 is added
+        token_store.get_token(syn, "syn_1", "read_only", min_remaining_life)
+        token_store.get_token(syn, "syn_3", "read_only", min_remaining_life)
+
+        assert ["syn_1", "syn_3"] == list(token_store._tokens["read_only"].keys())
+        assert syn.restGET.call_count == 3
+
+    def test_cache_hit_without_lock(self):
+        """Verify that a cache hit is returned without acquiring the store lock."""
+        token_store = StsTokenStore()
+        min_remaining_life = datetime.timedelta(hours=1)
+        expiration = datetime_to_iso(
+            datetime.datetime.utcnow() + datetime.timedelta(hours=10)
+        )
+        token = {"accessKeyId": "123", "expiration": expiration}
+        syn = mock.Mock(restGET=mock.Mock(return_value=token))
+
+        token_store.get_token(syn, "syn_1", "read_only", min_remaining_life)
+
+        token_store._lock = mock.MagicMock()
+        assert token is token_store.get_token(
+            syn, "syn_1", "read_only", min_remaining_life
+        )
+        assert not token_store._lock.__enter__.called
+        assert syn.restGET.call_count == 1
+
+    def test_expiration_parsed_once(self):
+        """Verify that the expiration of a cached token is only parsed when it is
+        added to the cache and not on every cache hit."""
+        token_store = StsTokenStore()
+        min_remaining_life = datetime.timedelta(hours=1)
+        expiration = datetime_to_iso(
+            datetime.datetime.utcnow() + datetime.timedelta(hours=10)
+        )
+        token = {"accessKeyId": "123", "expiration": expiration}
+        syn = mock.Mock(restGET=mock.Mock(return_value=token))
+
+        with mock.patch.object(
+            sts_transfer,
+            "_parse_sts_expiration",
+            wraps=sts_transfer._parse_sts_expiration,
+        ) as mock_parse:
+            for _ in range(3):
+                assert token is token_store.get_token(
+                    syn, "syn_1", "read_only", min_remaining_life
+                )
+
+        mock_parse.assert_called_once_with(expiration)
+
+    def test_concurrent_fetches__different_entities(self):
+        """Verify that fetching a token for one entity doesn't block fetching a token
+        for another entity at the same time."""
+        token_store = StsTokenStore()
+        min_remaining_life = datetime.timedelta(hours=1)
+        expiration = datetime_to_iso(
+            datetime.datetime.utcnow() + datetime.timedelta(hours=10)
+        )
+
+        # both fetches must be in progress at the same time to pass the barrier
+        barrier = threading.Barrier(2, timeout=5)
+
+        def synGET(uri):
+            barrier.wait()
+            return {"accessKeyId": uri, "expiration": expiration}
+
+        syn = mock.Mock(restGET=mock.Mock(side_effect=synGET))
+
+        with ThreadPoolExecutor(max_workers=2) as executor:
+            futures = [
+                executor.submit(
+                    token_store.get_token,
+                    syn,
+                    entity_id,
+                    "read_only",
+                    min_remaining_life,
+                )
+                for entity_id in ("syn_1", "syn_2")
+            ]
+            tokens = [f.result() for f in futures]
+
+        assert [
+            "/entity/syn_1/sts?permission=read_only",
+            "/entity/syn_2/sts?permission=read_only",
+        ] == [t["accessKeyId"] for t in tokens]
+        assert syn.restGET.call_count == 2
+
+    def test_concurrent_fetches__same_entity(self):
+        """Verify that concurrent requests for the same token wait on a single fetch."""
+        token_store = StsTokenStore()
+        min_remaining_life = datetime.timedelta(hours=1)
+        expiration = datetime_to_iso(
+            datetime.datetime.utcnow() + datetime.timedelta(hours=10)
+        )
+        token = {"accessKeyId": "123", "expiration": expiration}
+
+        fetch_started = threading.Event()
+        release_fetch = threading.Event()
+
+        def synGET(uri):
+            fetch_started.set()
+            assert release_fetch.wait(timeout=5)
+            return token
+
+        syn = mock.Mock(restGET=mock.Mock(side_effect=synGET))
+
+        with ThreadPoolExecutor(max_workers=2) as executor:
+            first = executor.submit(
+                token_store.get_token, syn, "syn_1", "read_only", min_remaining_life
+            )
+            assert fetch_started.wait(timeout=5)
+            second = executor.submit(
+                token_store.get_token, syn, "syn_1", "read_only", min_remaining_life
+            )
+            release_fetch.set()
+
+            assert first.result() is token
+            assert second.result() is token
+
+        assert syn.restGET.call_count == 1
+        assert not token_store._fetches_in_flight
+
+    def test_failed_fetch_not_cached(self):
+        """Verify that a failed fetch is raised and a later request fetches again."""
+        token_store = StsTokenStore()
+        min_remaining_life = datetime.timedelta(hours=1)
+        expiration = datetime_to_iso(
+            datetime.datetime.utcnow() + datetime.timedelta(hours=10)
+        )
+        token = {"accessKeyId": "123", "expiration": expiration}
+        syn = mock.Mock(restGET=mock.Mock(side_effect=[ValueError("boom"), token]))
+
+        with pytest.raises(ValueError):
+            token_store.get_token(syn, "syn_1", "read_only", min_remaining_life)
+
+        assert token is token_store.get_token(
+            syn, "syn_1", "read_only", min_remaining_life
+        )
+        assert syn.restGET.call_count == 2
+
     @mock.patch("synapseclient.core.sts_transfer.StsTokenStore._fetch_token")
     def test_synapse_client__discrete_sts_token_stores(self, mock_fetch_token):
         """Verify that two Synapse objects will not share the same cached tokens"""
@@ -473,6 +708,54 @@ class TestWithBotoStsCredentials:
         assert result == return_value
         assert call_count == 2
 
+    def test_expired_creds__client_error(self, mock_get_sts_credentials):
+        """Verify that a botocore client error with an ExpiredToken code retries once."""
+
+        return_value = "success!!!"
+        call_count = 0
+
+        def fn(credentials):
+            nonlocal call_count
+            call_count += 1
+            if call_count < 2:
+                raise botocore.exceptions.ClientError(
+                    {"Error": {"Code": "ExpiredToken", "Message": "expired"}},
+                    "HeadObject",
+                )
+
+            return return_value
+
+        syn = mock.Mock()
+        entity_id = "syn_1"
+        permission = "read_write"
+        mock_get_sts_credentials.return_value = self._make_credentials()
+
+        result = with_boto_sts_credentials(fn, syn, entity_id, permission)
+        assert result == return_value
+        assert call_count == 2
+
+    def test_other_client_error(self, mock_get_sts_credentials):
+        """Verify that a botocore client error with another code is raised straight
+        away, even if its message mentions ExpiredToken."""
+        call_count = 0
+
+        def fn(credentials):
+            nonlocal call_count
+            call_count += 1
+            raise botocore.exceptions.ClientError(
+                {"Error": {"Code": "AccessDenied", "Message": "not an ExpiredToken"}},
+                "HeadObject",
+            )
+
+        syn = mock.Mock()
+        entity_id = "syn_1"
+        permission = "read_write"
+        mock_get_sts_credentials.return_value = self._make_credentials()
+
+        with pytest.raises(botocore.exceptions.ClientError):
+            with_boto_sts_credentials(fn, syn, entity_id, permission)
+        assert 1 == call_count
+
     def test_error_raised_if_multiple_errors(self, mock_get_sts_credentials):
         """Verify that if we end up with multiple consecutive expired error tokens
         somehow we just raise it and don't get stuck in an infinite retry loop"""
@@ -495,9 +778,72 @@ class TestWithBotoStsCredentials:
         assert 2 == call_count
 
 
+class TestBotoSessionCache:
+    @pytest.fixture(autouse=True)
+    def isolate_boto_sessions(self):
+        # the sessions cached by get_boto_session live for the whole process, give
+        # each test its own so mock sessions don't leak into other tests
+        with mock.patch.object(sts_transfer, "_boto_sessions", threading.local()):
+            yield
+
+    @staticmethod
+    def _make_credentials(session_token):
+        return {
+            "aws_access_key_id": "foo",
+            "aws_secret_access_key": "bar",
+            "aws_session_token": session_token,
+        }
+
+    @mock.patch.object(sts_transfer.boto3.session, "Session")
+    def test_session_reused(self, mock_session):
+        """Verify that a session is only created once for the same credentials"""
+        mock_session.side_effect = lambda **kwargs: mock.Mock()
+        session_cache = _BotoSessionCache()
+
+        session = session_cache.get_session(self._make_credentials("token_1"))
+        assert session is session_cache.get_session(self._make_credentials("token_1"))
+        mock_session.assert_called_once_with(**self._make_credentials("token_1"))
+
+        other_session = session_cache.get_session(self._make_credentials("token_2"))
+        assert other_session is not session
+        assert 2 == mock_session.call_count
+
+    @mock.patch.object(sts_transfer.boto3.session, "Session")
+    def test_least_recently_used_evicted(self, mock_session):
+        """Verify that the least recently used session is evicted when the cache is full"""
+        mock_session.side_effect = lambda **kwargs: mock.Mock()
+        session_cache = _BotoSessionCache(max_size=2)
+
+        session_1 = session_cache.get_session(self._make_credentials("token_1"))
+        session_cache.get_session(self._make_credentials("token_2"))
+
+        # using token_1 again makes token_2 the least recently used
+        session_cache.get_session(self._make_credentials("token_1"))
+        session_cache.get_session(self._make_credentials("token_3"))
+
+        assert ["token_1", "token_3"] == list(session_cache.keys())
+        assert session_1 is session_cache.get_session(self._make_credentials("token_1"))
+        assert 3 == mock_session.call_count
+
+    @mock.patch.object(sts_transfer.boto3.session, "Session")
+    def test_get_boto_session__per_thread(self, mock_session):
+        """Verify that sessions are reused within a thread but not shared between threads"""
+        mock_session.side_effect = lambda **kwargs: mock.Mock()
+        credentials = self._make_credentials("per_thread_token")
+
+        session = sts_transfer.get_boto_session(credentials)
+        assert session is sts_transfer.get_boto_session(credentials)
+
+        with ThreadPoolExecutor(max_workers=1) as executor:
+            other_thread_session = executor.submit(
+                sts_transfer.get_boto_session, credentials
+            ).result()
+        assert other_thread_session is not session
+
+
 class TestIsBotoStsTransferEnabled:
-    @mock.patch.object(sts_transfer, "boto3", new_callable=mock.PropertyMock)
-    def test_config_enabled(self, mock_boto3):
+    @mock.patch.object(sts_transfer, "_BOTO3_AVAILABLE", True)
+    def test_config_enabled(self):
         """Verify that so long as boto3 is importable we are enabled for boto transfers
         if the synapse object is configured for it"""
 
@@ -506,10 +852,8 @@ class TestIsBotoStsTransferEnabled:
             syn.use_boto_sts_transfers = val
             assert val == sts_transfer.is_boto_sts_transfer_enabled(syn)
 
-    @mock.patch.object(
-        sts_transfer, "boto3", new_callable=mock.PropertyMock(return_value=None)
-    )
-    def test_boto_import_required(self, mock_boto3):
+    @mock.patch.object(sts_transfer, "_BOTO3_AVAILABLE", False)
+    def test_boto_import_required(self):
         """Verify that if boto3 is not importable that sts transfers are always
         disabled no matter what the config says."""
 
@@ -543,7 +887,6 @@ class TestIsStorageLocationStsEnabled:
         """Test with determining if a storage_location_id is STS enabled by
         fetching the upload destination."""
 
-        syn = mock.Mock()
         entity_id = "syn_1"
         storage_location_id = 1234
 
@@ -552,6 +895,7 @@ class TestIsStorageLocationStsEnabled:
             if sts_enabled:
                 location["stsEnabled"] = sts_enabled
 
+            syn = mock.Mock(_sts_token_store=StsTokenStore())
             syn.restGET.return_value = location
             assert bool(sts_enabled) == sts_transfer.is_storage_location_sts_enabled(
                 syn, entity_id, storage_location_id
@@ -561,3 +905,38 @@ class TestIsStorageLocationStsEnabled:
                 f"/entity/{entity_id}/uploadDestination/{storage_location_id}",
                 endpoint=syn.fileHandleEndpoint,
             )
+
+    def test_storage_location_id__cached(self):
+        """Verify that the upload destination of a storage location id is only
+        fetched once, even when checked for different entities."""
+
+        syn = mock.Mock(_sts_token_store=StsTokenStore())
+        syn.restGET.return_value = {"stsEnabled": True}
+        storage_location_id = 1234
+
+        for entity_id in ("syn_1", "syn_2"):
+            assert sts_transfer.is_storage_location_sts_enabled(
+                syn, entity_id, storage_location_id
+            )
+
+        syn.restGET.assert_called_once_with(
+            f"/entity/syn_1/uploadDestination/{storage_location_id}",
+            endpoint=syn.fileHandleEndpoint,
+        )
+
+    def test_storage_location_id__cache_bounded(self):
+        """Verify that only the most recently used storage locations stay cached."""
+
+        syn = mock.Mock(
+            _sts_token_store=StsTokenStore(max_sts_enabled_location_cache_size=2)
+        )
+        syn.restGET.return_value = {"stsEnabled": True}
+
+        for storage_location_id in (1, 2, 1, 3):
+            assert sts_transfer.is_storage_location_sts_enabled(
+                syn, "syn_1", storage_location_id
+            )
+
+        # location 2 was the least recently used when location 3 was added
+        assert [1, 3] == list(syn._sts_token_store._sts_enabled_locations.keys())
+        assert 3 == syn.restGET.call_count
@@ -1,4 +1,7 @@
 """Tests for the Folder class."""
+import asyncio
+import gc
+import threading
 import uuid
 from typing import Dict
 from unittest.mock import AsyncMock, patch
@@ -769,3 +772,93 @@ class TestFolder:
             assert result.modified_by == MODIFIED_BY
             assert result.files[0].id == SYN_456
             assert result.files[0].name == "example_file_1"
+
+    async def test_sync_from_synapse_lists_children_while_getting(self) -> None:
+        # GIVEN a Folder object with an ID
+        folder = Folder(
+            id=SYN_123,
+        )
+
+        # AND a listing of children that records when it has started
+        children_listed = threading.Event()
+
+        def get_children(*args, **kwargs):
+            children_listed.set()
+            return []
+
+        # AND a get of the folder that only finishes once the children are listed
+        async def get_folder(*args, **kwargs):
+            listed = await asyncio.get_running_loop().run_in_executor(
+                None, children_listed.wait, 5
+            )
+            assert listed
+            return self.get_example_rest_api_folder_output()
+
+        # WHEN I call `sync_from_synapse` with the Folder object
+        with patch.object(
+            self.syn,
+            "getChildren",
+            side_effect=get_children,
+        ) as mocked_children_call, patch(
+            "synapseclient.api.entity_factory.get_entity_id_bundle2",
+            new_callable=AsyncMock,
+            side_effect=get_folder,
+        ) as mocked_folder_get:
+            result = await folder.sync_from_synapse_async(synapse_client=self.syn)
+
+            # THEN the children were listed without waiting for the get to finish
+            mocked_children_call.assert_called_once()
+            mocked_folder_get.assert_called_once()
+            assert result.name == FOLDER_NAME
+            assert result.files == []
+            assert result.folders == []
+
+    async def test_sync_from_synapse_get_fails(self) -> None:
+        # GIVEN a Folder object with an ID
+        folder = Folder(
+            id=SYN_123,
+        )
+
+        # AND a listing of children that also fails, after the get has failed
+        get_failed = threading.Event()
+        listing_done = threading.Event()
+
+        def get_children(*args, **kwargs):
+            try:
+                get_failed.wait(5)
+                raise PermissionError("listing failed")
+            finally:
+                listing_done.set()
+
+        # AND an event loop that records any unhandled errors
+        loop = asyncio.get_running_loop()
+        unhandled_errors = []
+        previous_handler = loop.get_exception_handler()
+        loop.set_exception_handler(
+            lambda loop, context: unhandled_errors.append(context)
+        )
+
+        try:
+            # WHEN I call `sync_from_synapse` and the get of the folder fails
+            with patch.object(
+                self.syn,
+                "getChildren",
+                side_effect=get_children,
+            ), patch(
+                "synapseclient.api.entity_factory.get_entity_id_bundle2",
+                new_callable=AsyncMock,
+                side_effect=SynapseNotFoundError("get failed"),
+            ):
+                # THEN the error from the get is raised
+                with pytest.raises(SynapseNotFoundError, match="get failed"):
+                    await folder.sync_from_synapse_async(synapse_client=self.syn)
+
+                get_failed.set()
+                assert await loop.run_in_executor(None, listing_done.wait, 5)
+
+            # AND the failed listing is not reported as never retrieved
+            await asyncio.sleep(0.1)
+            gc.collect()
+            assert unhandled_errors == []
+        finally:
+            loop.set_exception_handler(previous_handler)
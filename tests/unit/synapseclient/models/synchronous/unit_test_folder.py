@@ -765,3 +765,22 @@ class TestFolder:
             assert result.modified_by == MODIFIED_BY
             assert result.files[0].id == SYN_456
             assert result.files[0].name == "example_file_1"
+
+    def test_flatten_file_list(self) -> None:
+        # GIVEN a folder hierarchy with files at multiple levels
+        file_1 = File(id="syn1")
+        file_2 = File(id="syn2")
+        file_3 = File(id="syn3")
+        file_4 = File(id="syn4")
+        sub_sub_folder = Folder(id="syn10", files=[file_3])
+        sub_folder_1 = Folder(id="syn11", files=[file_2], folders=[sub_sub_folder])
+        sub_folder_2 = Folder(id="syn12", files=[file_4])
+        folder = Folder(
+            id=SYN_123, files=[file_1], folders=[sub_folder_1, sub_folder_2]
+        )
+
+        # WHEN I flatten the file list
+        result = folder.flatten_file_list()
+
+        # THEN I expect all files depth first with each folder's files first
+        assert [f.id for f in result] == ["syn1", "syn2", "syn3", "syn4"]
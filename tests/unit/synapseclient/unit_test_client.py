@@ -450,7 +450,7 @@ class TestDownloadFileHandle:
             endpoint_url=None,
             remote_file_key=FOO_KEY,
             download_file_path="/tmp",
-            credentials=credentials,
+            boto_session=mock_sts_transfer.get_boto_session.return_value,
             progress_bar=ANY,
             transfer_config_kwargs={"max_concurrency": self.syn.max_threads},
         )
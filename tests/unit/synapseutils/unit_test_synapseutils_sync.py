@@ -19,7 +19,7 @@ from synapseclient import Activity
 from synapseclient import File as SynapseFile
 from synapseclient import Folder, Project, Schema, Synapse
 from synapseclient.core.constants import concrete_types, method_flags
-from synapseclient.core.exceptions import SynapseHTTPError
+from synapseclient.core.exceptions import SynapseFileNotFoundError, SynapseHTTPError
 from synapseclient.core.utils import id_of
 from synapseclient.models import File
 from synapseutils import sync
@@ -248,6 +248,169 @@ def test_read_manifest_file_synapse_store_values_are_set(syn: Synapse) -> None:
         assert expected_synapseStore == actual_synapseStore
 
 
+def test_read_manifest_file_numeric_boolean_values(syn: Synapse) -> None:
+    """Verify synapseStore and forceVersion written as numbers are read as bools"""
+    project_id = SYN_123
+    header = "path\tparent\tsynapseStore\tforceVersion\n"
+    path1 = os.path.abspath(os.path.expanduser("~/file1.txt"))
+    path2 = os.path.abspath(os.path.expanduser("~/file2.txt"))
+    path3 = os.path.abspath(os.path.expanduser("~/file3.txt"))
+
+    row1 = "%s\t%s\t0\t0\n" % (path1, project_id)
+    row2 = "%s\t%s\t1\t1\n" % (path2, project_id)
+    row3 = "%s\t%s\t0.0\t2\n" % (path3, project_id)
+
+    expected_synapse_store = {
+        str(path1): False,
+        str(path2): True,
+        str(path3): False,
+    }
+    expected_force_version = {
+        str(path1): False,
+        str(path2): True,
+        str(path3): True,
+    }
+
+    manifest = StringIO(header + row1 + row2 + row3)
+    with patch.object(syn, "get", return_value=Project()), patch.object(
+        sync, "_check_size_each_file", return_value=Mock()
+    ), patch.object(os.path, "isfile", return_value=True):
+        manifest_dataframe = synapseutils.sync.readManifestFile(syn, manifest)
+
+        manifest_dataframe = manifest_dataframe.set_index("path")
+        assert expected_synapse_store == manifest_dataframe["synapseStore"].to_dict()
+        assert expected_force_version == manifest_dataframe["forceVersion"].to_dict()
+
+
+def test_read_manifest_file_force_version_values(syn: Synapse) -> None:
+    project_id = SYN_123
+    header = "path\tparent\tforceVersion\tfoo\n"
+    path1 = os.path.abspath(os.path.expanduser("~/file1.txt"))
+    path2 = os.path.abspath(os.path.expanduser("~/file2.txt"))
+    path3 = os.path.abspath(os.path.expanduser("~/file3.txt"))
+
+    row1 = "%s\t%s\tTrue\t1\n" % (path1, project_id)
+    row2 = "%s\t%s\tFalse\t\n" % (path2, project_id)
+    row3 = "%s\t%s\t\t2\n" % (path3, project_id)
+
+    expected_force_version = {
+        str(path1): True,
+        str(path2): False,
+        str(path3): False,
+    }
+    # cells are read as strings and empty cells are read as empty strings
+    expected_foo = {
+        str(path1): "1",
+        str(path2): "",
+        str(path3): "2",
+    }
+
+    manifest = StringIO(header + row1 + row2 + row3)
+    with patch.object(syn, "get", return_value=Project()), patch.object(
+        sync, "_check_size_each_file", return_value=Mock()
+    ), patch.object(os.path, "isfile", return_value=True):
+        manifest_dataframe = synapseutils.sync.readManifestFile(syn, manifest)
+
+        manifest_dataframe = manifest_dataframe.set_index("path")
+        assert expected_force_version == manifest_dataframe["forceVersion"].to_dict()
+        assert expected_foo == manifest_dataframe["foo"].to_dict()
+
+
+def test_read_manifest_file_annotation_values(syn: Synapse) -> None:
+    """Verify NA markers are read as empty cells and numbers are kept as written"""
+    project_id = SYN_123
+    header = "path\tparent\tfoo\n"
+    na_markers = ["NA", "N/A", "null", "#N/A", "None"]
+    paths = [
+        os.path.abspath(os.path.expanduser(f"~/file{i}.txt"))
+        for i in range(len(na_markers) + 1)
+    ]
+
+    rows = [
+        "%s\t%s\t%s\n" % (path, project_id, na_marker)
+        for path, na_marker in zip(paths, na_markers)
+    ]
+    rows.append("%s\t%s\t007\n" % (paths[-1], project_id))
+
+    expected_foo = {path: "" for path in paths[:-1]}
+    expected_foo[paths[-1]] = "007"
+
+    manifest = StringIO(header + "".join(rows))
+    with patch.object(syn, "get", return_value=Project()), patch.object(
+        sync, "_check_size_each_file", return_value=Mock()
+    ), patch.object(os.path, "isfile", return_value=True):
+        manifest_dataframe = synapseutils.sync.readManifestFile(syn, manifest)
+
+        manifest_dataframe = manifest_dataframe.set_index("path")
+        assert expected_foo == manifest_dataframe["foo"].to_dict()
+
+
+def test_sort_and_fix_provenance(syn: Synapse) -> None:
+    """Verify provenance cells are split apart and files are ordered so that
+    provenance dependencies are uploaded first"""
+    path1 = os.path.abspath(os.path.expanduser("~/file1.txt"))
+    path2 = os.path.abspath(os.path.expanduser("~/file2.txt"))
+    df = pd.DataFrame(
+        {
+            "path": [path1, path2],
+            "parent": [SYN_123, SYN_123],
+            "used": [f"{path2}; syn456", ""],
+            "executed": [GITHUB_URL, f"{SYNAPSE_URL};syn789.2"],
+        }
+    )
+
+    with patch.object(os.path, "isfile", side_effect=lambda p: p == path2):
+        result = sync._sortAndFixProvenance(syn, df)
+
+    assert [path2, path1] == result.path.tolist()
+    assert [[], [path2, "syn456"]] == result.used.tolist()
+    assert [[SYNAPSE_URL, "syn789.2"], [GITHUB_URL]] == result.executed.tolist()
+
+
+def test_sort_and_fix_provenance__file_checked_once(syn: Synapse) -> None:
+    """Verify a provenance file referenced by many rows is only checked once"""
+    path1 = os.path.abspath(os.path.expanduser("~/file1.txt"))
+    path2 = os.path.abspath(os.path.expanduser("~/file2.txt"))
+    path3 = os.path.abspath(os.path.expanduser("~/file3.txt"))
+    df = pd.DataFrame(
+        {
+            "path": [path1, path2, path3],
+            "parent": [SYN_123, SYN_123, SYN_123],
+            "used": ["", path1, path1],
+            "executed": ["", path1, ""],
+        }
+    )
+
+    with patch.object(os.path, "isfile", return_value=True) as mock_isfile:
+        result = sync._sortAndFixProvenance(syn, df)
+
+    assert path1 == result.path.tolist()[0]
+    mock_isfile.assert_called_once_with(path1)
+
+
+def test_sort_and_fix_provenance__external_file_looked_up_once(syn: Synapse) -> None:
+    """Verify a provenance file that is not being uploaded is only looked up in
+    Synapse once no matter how many rows reference it"""
+    path1 = os.path.abspath(os.path.expanduser("~/file1.txt"))
+    path2 = os.path.abspath(os.path.expanduser("~/file2.txt"))
+    external_path = os.path.abspath(os.path.expanduser("~/external.txt"))
+    df = pd.DataFrame(
+        {
+            "path": [path1, path2],
+            "parent": [SYN_123, SYN_123],
+            "used": [external_path, external_path],
+        }
+    )
+
+    with patch.object(os.path, "isfile", return_value=True), patch.object(
+        syn, "_getFromFile", side_effect=SynapseFileNotFoundError()
+    ) as mock_get_from_file:
+        result = sync._sortAndFixProvenance(syn, df)
+
+    assert [[external_path], [external_path]] == result.used.tolist()
+    mock_get_from_file.assert_called_once_with(external_path)
+
+
 def test_sync_from_synapse_non_file_entity(syn: Synapse) -> None:
     table_schema = "syn12345"
     with patch.object(syn, "getChildren", return_value=[]), patch.object(